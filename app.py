@@ -3,8 +3,7 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 from proxy import process_prompt
 from logger import log_request
-from email.mime.text import MIMEText
-import smtplib
+from mailer import send_contact_email
 import os
 
 # Load environment variables
@@ -62,14 +61,7 @@ def contact():
                         "body": body}), 400
 
     try:
-        msg = MIMEText(body, "html")
-        msg["Subject"] = f"{subject} - {to_email} - {company} - {inquiryType}"
-        msg["From"] = os.environ["EMAIL_USER"]
-        msg["To"] = "info@zeroharmai.com"   # send to our email box
-
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(os.environ["EMAIL_USER"], os.environ["EMAIL_PASS"])
-            server.send_message(msg)
+        send_contact_email(to_email, subject, body, company, inquiryType)
 
         return jsonify({"message": "Email sent successfully"}), 200
 
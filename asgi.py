@@ -0,0 +1,123 @@
+"""
+Async serving mode for the detection API
+
+Same routes and responses as app.py, served over ASGI so a single process
+can hold many open connections:
+- process_prompt (CPU-bound) runs on a dedicated thread pool
+- log writes and SMTP sends run off the event loop
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+"""
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import HTMLResponse, JSONResponse
+from starlette.routing import Route
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from proxy import process_prompt
+from logger import log_request_async
+from mailer import send_contact_email
+import asyncio
+import os
+
+# Load environment variables
+load_dotenv()
+
+# Detection runs on its own pool so slow inference can't starve log/SMTP threads.
+# Torch already spreads each inference over every core, so the pool stays small
+# and the cores are split between workers when it is raised.
+DETECTION_WORKERS = int(os.environ.get("DETECTION_WORKERS", 1))
+DETECTION_EXECUTOR = ThreadPoolExecutor(max_workers=DETECTION_WORKERS,
+                                        thread_name_prefix="detection")
+
+if DETECTION_WORKERS > 1:
+    try:
+        import torch
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // DETECTION_WORKERS))
+    except ImportError:
+        pass  # Regex-only install, nothing to oversubscribe
+
+
+async def check_privacy(request):
+    try:
+        data = await request.json()
+        prompt = data["text"]
+        # Log request
+        await log_request_async(prompt)
+
+        # Proxy to OpenAI or other service
+        loop = asyncio.get_running_loop()
+        redacted, detected = await loop.run_in_executor(
+            DETECTION_EXECUTOR, process_prompt, prompt)
+
+        return JSONResponse({
+            "redacted": redacted,
+            "detectors": detected,
+        })
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def health_check(request):
+    return HTMLResponse("Zero Harm AI Flask backend is running.")
+
+
+async def contact(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        # Flask's request.json answers a malformed body with 400
+        return JSONResponse({"error": "Invalid JSON body"}, status_code=400)
+    to_email = data.get("email")
+    subject = data.get("name")
+    body = data.get("message")
+    company = data.get("company")
+    inquiryType = data.get("inquiryType")
+
+    if not all([to_email, subject, body]):
+        return JSONResponse({"error": "Missing required fields",
+                             "to_email": to_email,
+                             "subject": subject,
+                             "body": body}, status_code=400)
+
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, send_contact_email, to_email, subject, body, company, inquiryType)
+
+        return JSONResponse({"message": "Email sent successfully"}, status_code=200)
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    DETECTION_EXECUTOR.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route("/api/check_privacy", check_privacy, methods=["POST"]),
+        Route("/api/health_check", health_check, methods=["GET"]),
+        Route("/api/contact", contact, methods=["POST"]),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware,
+                   allow_origins=["*"],
+                   allow_methods=["GET", "POST", "OPTIONS"],
+                   allow_headers=["Content-Type"]),
+    ],
+    lifespan=lifespan,
+)
+
+# Only run the development server locally
+if __name__ == "__main__":
+    import uvicorn
+    port = int(os.environ.get("PORT", 5000))
+    uvicorn.run("asgi:app", host="0.0.0.0", port=port)
@@ -1,3 +1,4 @@
+import asyncio
 import json
 from datetime import datetime, timezone
 from pathlib import Path
@@ -23,3 +24,8 @@ def audit_log(event_type, original, redacted, detected, metadata=None):
     }
     with LOG_PATH.open('a', encoding='utf-8') as f:
         f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+async def log_request_async(data):
+    """Non-blocking log_request for the ASGI app (file append runs in a thread)"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, log_request, data)
@@ -0,0 +1,16 @@
+from email.mime.text import MIMEText
+import smtplib
+import os
+
+CONTACT_INBOX = "info@zeroharmai.com"
+
+def send_contact_email(to_email, subject, body, company, inquiryType):
+    """Send a contact form submission to our email box (blocking SMTP call)"""
+    msg = MIMEText(body, "html")
+    msg["Subject"] = f"{subject} - {to_email} - {company} - {inquiryType}"
+    msg["From"] = os.environ["EMAIL_USER"]
+    msg["To"] = CONTACT_INBOX   # send to our email box
+
+    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
+        server.login(os.environ["EMAIL_USER"], os.environ["EMAIL_PASS"])
+        server.send_message(msg)
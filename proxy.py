@@ -1,16 +1,27 @@
 """
 Updated proxy.py to use the new AI-based detection pipeline
 """
+import threading
 from zero_harm_ai_detectors import ZeroHarmPipeline, PipelineConfig, RedactionStrategy, AI_DETECTION_AVAILABLE
+from structured import detect_payload_kind, extract_segments, SegmentDocument, merge_findings, ROLE_PROSE, ROLE_TOKEN
 
 # ==================== Pipeline Configuration ====================
 # Initialize the pipeline once (reused for all requests)
 PIPELINE = None
 HARMFUL_DETECTOR = None
 USE_AI_DETECTION = AI_DETECTION_AVAILABLE  # Automatically use AI if available
+# Guards lazy loading when prompts are processed on several threads (asgi.py)
+_INIT_LOCK = threading.Lock()
 
 def get_or_create_pipeline():
     """Get or create the detection pipeline (lazy loading)"""
+    if PIPELINE is None:
+        with _INIT_LOCK:
+            _create_pipeline()
+    return PIPELINE
+
+def _create_pipeline():
+    """Create the pipeline unless another thread already has (hold _INIT_LOCK)"""
     global PIPELINE
     if PIPELINE is None:
         if USE_AI_DETECTION:
@@ -36,6 +47,13 @@ def get_or_create_pipeline():
 
 def get_or_create_harmful_detector():
     """Get or create the harmful detector (lazy loading)"""
+    if HARMFUL_DETECTOR is None:
+        with _INIT_LOCK:
+            _create_harmful_detector()
+    return HARMFUL_DETECTOR
+
+def _create_harmful_detector():
+    """Create the harmful detector unless another thread already has (hold _INIT_LOCK)"""
     global HARMFUL_DETECTOR
     if HARMFUL_DETECTOR is None:
         try:
@@ -117,6 +135,11 @@ def process_prompt(prompt: str) -> tuple:
         # redacted = "Email me at [REDACTED_EMAIL]"
         # detected = {"EMAIL": [{"span": "test@example.com", ...}]}
     """
+    # JSON, code and log payloads: models only see values/comments/messages
+    kind = detect_payload_kind(prompt)
+    if kind is not None:
+        return process_prompt_structured(prompt, kind)
+
     if USE_AI_DETECTION:
         return process_prompt_ai(prompt)
     else:
@@ -225,6 +248,82 @@ def process_prompt_legacy(prompt: str) -> tuple:
     
     return redacted, detected
 
+def process_prompt_structured(prompt: str, kind: str) -> tuple:
+    """
+    Process a JSON, code or log payload without scanning its syntax
+
+    - Secrets and PII: regex over the whole payload, so text outside the
+      scanned segments (or a misclassified prompt) still gets regex coverage
+    - Free text (values, keys, comments, prose lines, log messages) and
+      single-word JSON values: PII + harmful content
+    - Identifier-like values and keys: regex PII only (no NER over identifiers)
+
+    All findings are reported at offsets in the original payload.
+    """
+    from zero_harm_ai_detectors import detect_pii, detect_secrets
+
+    segments = extract_segments(prompt, kind)
+    prose = SegmentDocument([s for s in segments if s["role"] == ROLE_PROSE])
+    tokens = SegmentDocument([s for s in segments if s["role"] == ROLE_TOKEN])
+
+    detected = {}
+    harmful_info = None
+
+    # Secrets first so they win over overlapping PII spans
+    merge_findings(detected, detect_secrets(prompt, use_ai=False) or {})
+    merge_findings(detected, detect_pii(prompt, use_ai=False) or {})
+
+    if prose.text:
+        if USE_AI_DETECTION:
+            pipeline = get_or_create_pipeline()
+            result = pipeline.detect(
+                prose.text,
+                redaction_strategy=RedactionStrategy.TOKEN,
+                detect_pii=True,
+                detect_secrets=False,
+                detect_harmful=True
+            )
+            findings = {}
+            for detection in result.detections:
+                if detection.type == "HARMFUL_CONTENT":
+                    continue
+                findings.setdefault(detection.type, []).append({
+                    "span": detection.text,
+                    "start": detection.start,
+                    "end": detection.end,
+                    "confidence": detection.confidence,
+                    "metadata": detection.metadata
+                })
+            merge_findings(detected, prose.remap(findings, prompt))
+            if result.harmful:
+                harmful_info = {
+                    "severity": result.severity,
+                    "labels": list(result.harmful_scores.keys()),
+                    "scores": result.harmful_scores
+                }
+        else:
+            pii = detect_pii(prose.text, use_ai=False) or {}
+            merge_findings(detected, prose.remap(pii, prompt))
+            harmful_result = detect_harmful_legacy(prose.text)
+            if harmful_result:
+                harmful_info = dict(harmful_result["HARMFUL_CONTENT"][0])
+
+    if tokens.text:
+        pii = detect_pii(tokens.text, use_ai=False) or {}
+        merge_findings(detected, tokens.remap(pii, prompt))
+
+    if harmful_info is not None:
+        # Harmful content blocks the whole payload, same as for plain prompts
+        harmful_info.update({"span": prompt, "start": 0, "end": len(prompt)})
+        detected["HARMFUL_CONTENT"] = [harmful_info]
+        redacted = f"[⚠️ HARMFUL CONTENT BLOCKED - {harmful_info['severity'].upper()} SEVERITY]"
+    elif detected:
+        redacted = custom_redact_text(prompt, detected)
+    else:
+        redacted = prompt
+
+    return redacted, detected
+
 # ==================== Custom Redaction ====================
 
 def custom_redact_text(text: str, findings: dict) -> str:
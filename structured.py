@@ -0,0 +1,475 @@
+"""
+Structure-aware routing for JSON, source code and log payloads
+
+Many prompts are really JSON blobs, stack traces or source code. Running the
+full NER and harmful-content models over braces, keys and identifiers wastes
+compute and produces false positives, so for those payloads the models only
+see the string values, comments and log messages, and findings are mapped
+back to offsets in the original payload. Cheap regex detectors still run
+over the whole payload (see proxy.process_prompt_structured).
+"""
+import bisect
+import json
+import re
+
+# ==================== Payload Classification ====================
+
+PAYLOAD_JSON = "json"
+PAYLOAD_CODE = "code"
+PAYLOAD_LOG = "log"
+
+# Segment roles decide which detectors run over a segment
+ROLE_PROSE = "prose"  # Free text: AI PII + harmful content
+ROLE_TOKEN = "token"  # Single values/identifiers: regex PII only
+
+LOG_LINE_RE = re.compile(
+    r"^\s*\[?(?:\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}"
+    r"|[A-Z][a-z]{2} +\d{1,2} \d{2}:\d{2}:\d{2}"
+    r"|(?:TRACE|DEBUG|INFO|WARN|WARNING|ERROR|CRITICAL|FATAL)\b)"
+)
+LOG_PREFIX_RE = re.compile(
+    r"^\s*(?:\[?\d{4}-\d{2}-\d{2}[T ][\d:.,]+(?:Z|[+-]\d{2}:?\d{2})?\]?\s*"
+    r"|\[?[A-Z][a-z]{2} +\d{1,2} \d{2}:\d{2}:\d{2}\]?\s*)?"
+    r"(?:[\[<]?(?:TRACE|DEBUG|INFO|WARN|WARNING|ERROR|CRITICAL|FATAL)[\]>:]?\s*)?"
+    r"(?:\[[^\]\n]*\]\s*)*"
+)
+TRACEBACK_RE = re.compile(r"^Traceback \(most recent call last\):", re.MULTILINE)
+PY_FRAME_RE = re.compile(r'^\s+File "[^"\n]*", line \d+')
+JAVA_FRAME_RE = re.compile(r"^\s+(?:at [\w$.<>/]+\(.*\)|\.\.\. \d+ more)\s*$")
+# Lines that are unambiguously code (definitions, imports, declarations, calls)
+CODE_LINE_RE = re.compile(
+    r"^\s*(?:(?:def|class|fn|func|function)\s+\w+\s*[(:<{]"
+    r"|import\s+[\w.{*]+|from\s+[\w.]+\s+import\s|#include\s*[<\"]"
+    r"|using\s+[\w.]+;|package\s+[\w.]+;?\s*$"
+    r"|(?:const|let|var)\s+\w+\s*="
+    r"|(?:public|private|protected)\s+(?:static\s+)?[\w<>\[\]]+\s+\w+"
+    r"|[\w<>\[\]*]+\s+\*?\w+\s*\([^()]*\)\s*\{\s*$"
+    r"|(?:if|for|while|switch)\s*\(.*\)\s*\{?\s*$"
+    r"|return\b[^.!?]*;\s*$"
+    r"|(?:if|elif|for|while|with|try|else|except)\b[^.!?,]*:\s*$"
+    r"|[A-Za-z_][\w.]*(?:\[[^\]]*\])?\s*[+\-*/]?=\s*[^=\s]"
+    r"|[\w.]+\([^()]*\);?\s*$)"
+)
+# Lines that only carry structure (closing brackets), counted toward the ratio
+CODE_STRUCTURE_RE = re.compile(r"^\s*[}\])]+[;,]?\s*$")
+# Lines holding only a comment - its text is extracted by _code_segments
+COMMENT_LINE_RE = re.compile(r"^\s*(?:#|//|/\*)")
+# Markdown code fence (```python / ~~~)
+FENCE_RE = re.compile(r"^\s*(?:```|~~~)[\w+#.-]*\s*$")
+PROSE_RE = re.compile(r"[^\W\d_]{2,}\s+[^\W\d_]")
+# Single words such as names and cities - JSON values the NER pass must still see
+WORD_RE = re.compile(r"^[^\W\d_][^\W\d_'.-]*$")
+
+# Share of non-blank lines that must look like log/code lines
+STRUCTURE_LINE_RATIO = 0.5
+# Code needs several strong lines - misrouted prose would skip the NER pass
+CODE_MIN_LINES = 3
+CODE_MIN_STRONG_LINES = 2
+
+
+def detect_payload_kind(text: str):
+    """
+    Classify a prompt as a structured payload
+
+    Args:
+        text: Input text to classify
+
+    Returns:
+        PAYLOAD_JSON, PAYLOAD_LOG, PAYLOAD_CODE, or None for plain text
+    """
+    stripped = text.strip()
+    if not stripped:
+        return None
+
+    if stripped[0] in "{[" and stripped[-1] in "}]":
+        try:
+            json.loads(stripped)
+            return PAYLOAD_JSON
+        except ValueError:
+            pass
+
+    lines = [line for line in stripped.splitlines() if line.strip()]
+    # A single line is never treated as structured - prose is the safe default
+    if len(lines) < 2:
+        return None
+
+    if TRACEBACK_RE.search(stripped) or any(JAVA_FRAME_RE.match(line) for line in lines):
+        return PAYLOAD_LOG
+    if _line_ratio(lines, LOG_LINE_RE) >= STRUCTURE_LINE_RATIO:
+        return PAYLOAD_LOG
+    if _looks_like_code(lines):
+        return PAYLOAD_CODE
+    return None
+
+
+def _line_ratio(lines: list, pattern) -> float:
+    return sum(1 for line in lines if pattern.match(line)) / len(lines)
+
+
+def _looks_like_code(lines: list) -> bool:
+    if len(lines) < CODE_MIN_LINES:
+        return False
+    strong = sum(1 for line in lines if CODE_LINE_RE.match(line))
+    if strong < CODE_MIN_STRONG_LINES:
+        return False
+    # Indented lines and bare closing brackets support, but never prove, code
+    supporting = sum(
+        1 for line in lines
+        if not CODE_LINE_RE.match(line) and _is_supporting_code_line(line)
+    )
+    return (strong + supporting) / len(lines) >= STRUCTURE_LINE_RATIO
+
+
+def _is_supporting_code_line(line: str) -> bool:
+    return bool(CODE_STRUCTURE_RE.match(line)) or line[:1].isspace()
+
+
+# ==================== Segment Extraction ====================
+
+def extract_segments(text: str, kind: str) -> list:
+    """
+    Extract the scannable parts of a structured payload
+
+    Args:
+        text: Original payload
+        kind: One of PAYLOAD_JSON, PAYLOAD_CODE, PAYLOAD_LOG
+
+    Returns:
+        List of segments:
+        {
+            "text": segment text to scan,
+            "offsets": raw payload offset of each character, plus the end offset,
+            "role": ROLE_PROSE | ROLE_TOKEN
+        }
+    """
+    if kind == PAYLOAD_JSON:
+        return _json_segments(text)
+    if kind == PAYLOAD_CODE:
+        return _code_payload_segments(text)
+    if kind == PAYLOAD_LOG:
+        return _log_segments(text)
+    raise ValueError(f"Unknown payload kind: {kind}")
+
+
+def _make_segment(text: str, offsets: list, role=None) -> dict:
+    if role is None:
+        role = ROLE_PROSE if PROSE_RE.search(text) else ROLE_TOKEN
+    return {"text": text, "offsets": offsets, "role": role}
+
+
+def _raw_segment(text: str, start: int, end: int):
+    """Segment over text[start:end] with trimmed whitespace, or None if blank"""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if start == end:
+        return None
+    return _make_segment(text[start:end], list(range(start, end + 1)))
+
+
+def _prose_segment(text: str, start: int, end: int):
+    """Like _raw_segment, but always scanned as free text (comments, prose lines)"""
+    segment = _raw_segment(text, start, end)
+    if segment is not None:
+        segment["role"] = ROLE_PROSE
+    return segment
+
+
+JSON_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+JSON_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?")
+
+
+def _json_segments(text: str) -> list:
+    """String keys, string values and numbers of a JSON document"""
+    segments = []
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch == '"':
+            decoded, offsets, i = _decode_json_string(text, i)
+            # A string followed by ':' is an object key, routed by shape alone;
+            # single-word values ("Bob", "Paris") still go to the NER pass
+            j = i
+            while j < n and text[j].isspace():
+                j += 1
+            is_key = j < n and text[j] == ":"
+            role = ROLE_PROSE if not is_key and WORD_RE.match(decoded) else None
+            if decoded.strip():
+                segments.append(_make_segment(decoded, offsets, role))
+        elif ch == "-" or ch.isdigit():
+            match = JSON_NUMBER_RE.match(text, i)
+            end = match.end() if match else i + 1
+            segments.append(_make_segment(text[i:end], list(range(i, end + 1))))
+            i = end
+        else:
+            i += 1
+    return segments
+
+
+def _decode_json_string(text: str, start: int) -> tuple:
+    """
+    Decode the JSON string literal opening at text[start]
+
+    Returns:
+        (decoded, offsets, index after the closing quote)
+    """
+    chars = []
+    offsets = []
+    i = start + 1
+    n = len(text)
+    while i < n and text[i] != '"':
+        offsets.append(i)
+        if text[i] == "\\" and i + 1 < n:
+            esc = text[i + 1]
+            if esc == "u" and i + 6 <= n:
+                code = int(text[i + 2:i + 6], 16)
+                low = _low_surrogate(text, i + 6)
+                if 0xD800 <= code <= 0xDBFF and low is not None:
+                    # Surrogate pair: one character starting at the first escape
+                    code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                    i += 6
+                elif 0xD800 <= code <= 0xDFFF:
+                    # Lone surrogates can't be UTF-8 encoded for the tokenizer
+                    code = 0xFFFD
+                chars.append(chr(code))
+                i += 6
+            else:
+                chars.append(JSON_ESCAPES.get(esc, esc))
+                i += 2
+        else:
+            chars.append(text[i])
+            i += 1
+    offsets.append(i)
+    return "".join(chars), offsets, i + 1
+
+
+def _low_surrogate(text: str, i: int):
+    """Code point of a \\uDC00-\\uDFFF escape at text[i], else None"""
+    if text.startswith("\\u", i) and i + 6 <= len(text):
+        try:
+            code = int(text[i + 2:i + 6], 16)
+        except ValueError:
+            return None
+        if 0xDC00 <= code <= 0xDFFF:
+            return code
+    return None
+
+
+def _code_payload_segments(text: str) -> list:
+    """
+    Code lines contribute their literals and comments; every other line
+    (prose around the code, outside a fenced block) is kept whole as prose
+    """
+    segments = []
+    run_start = None  # Start of the current run of code lines
+    in_fence = False
+    pos = 0
+    for line in text.splitlines(keepends=True):
+        start, end = pos, pos + len(line.rstrip("\r\n"))
+        pos += len(line)
+        content = text[start:end]
+
+        if FENCE_RE.match(content):
+            is_code = False
+            in_fence = not in_fence
+        elif in_fence or not content.strip():
+            is_code = True
+        else:
+            is_code = (bool(CODE_LINE_RE.match(content) or COMMENT_LINE_RE.match(content))
+                       or _is_supporting_code_line(content))
+
+        if is_code:
+            if run_start is None:
+                run_start = start
+            continue
+        if run_start is not None:
+            segments.extend(_code_segments(text, run_start, start))
+            run_start = None
+        if not FENCE_RE.match(content):
+            segment = _prose_segment(text, start, end)
+            if segment is not None:
+                segments.append(segment)
+
+    if run_start is not None:
+        segments.extend(_code_segments(text, run_start, len(text)))
+    return segments
+
+
+def _code_segments(text: str, start: int, end: int) -> list:
+    """String literals and comments in text[start:end]"""
+    segments = []
+    i = start
+    while i < end:
+        if text.startswith("```", i):
+            # Markdown fence marker, not a template literal
+            i += 3
+            continue
+        if text.startswith("#", i) or text.startswith("//", i):
+            marker = 1 if text[i] == "#" else 2
+            line_end = text.find("\n", i, end)
+            line_end = end if line_end == -1 else line_end
+            segment = _prose_segment(text, i + marker, line_end)
+            i = line_end
+        elif text.startswith("/*", i):
+            close = text.find("*/", i + 2, end)
+            close = end if close == -1 else close
+            segment = _prose_segment(text, i + 2, close)
+            i = close + 2
+        elif text.startswith('"""', i) or text.startswith("'''", i):
+            quote = text[i:i + 3]
+            close = text.find(quote, i + 3, end)
+            close = end if close == -1 else close
+            segment = _raw_segment(text, i + 3, close)
+            i = close + 3
+        elif text[i] in "\"'`":
+            close = _find_closing_quote(text, i, end)
+            if close == -1:
+                # Unterminated on this line (apostrophe, lifetime, char literal...)
+                i += 1
+                continue
+            segment = _raw_segment(text, i + 1, close)
+            i = close + 1
+        else:
+            i += 1
+            continue
+        if segment is not None:
+            segments.append(segment)
+    return segments
+
+
+def _find_closing_quote(text: str, start: int, end: int) -> int:
+    quote = text[start]
+    i = start + 1
+    while i < end:
+        ch = text[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == quote:
+            return i
+        if ch == "\n" and quote != "`":
+            return -1
+        i += 1
+    return -1
+
+
+def _log_segments(text: str) -> list:
+    """Log messages as prose, traceback source lines as code, frames skipped"""
+    segments = []
+    after_frame = False
+    pos = 0
+    for line in text.splitlines(keepends=True):
+        start, end = pos, pos + len(line.rstrip("\r\n"))
+        pos += len(line)
+        content = text[start:end]
+
+        if PY_FRAME_RE.match(content):
+            after_frame = True
+            continue
+        if JAVA_FRAME_RE.match(content):
+            after_frame = False
+            continue
+        if after_frame and content[:1].isspace():
+            # Source line quoted by a Python traceback
+            segments.extend(_code_segments(text, start, end))
+            after_frame = False
+            continue
+        after_frame = False
+
+        prefix = LOG_PREFIX_RE.match(content)
+        segment = _raw_segment(text, start + prefix.end(), end)
+        if segment is not None:
+            segments.append(segment)
+    return segments
+
+
+# ==================== Offset Mapping ====================
+
+SEGMENT_SEPARATOR = "\n"
+
+
+class SegmentDocument:
+    """
+    Joins segments into one scannable text so each detector runs once,
+    and maps detector offsets in that text back to the original payload
+    """
+
+    def __init__(self, segments: list):
+        self.segments = segments
+        self.starts = []
+        parts = []
+        cursor = 0
+        for segment in segments:
+            self.starts.append(cursor)
+            parts.append(segment["text"])
+            cursor += len(segment["text"]) + len(SEGMENT_SEPARATOR)
+        self.text = SEGMENT_SEPARATOR.join(parts)
+
+    def to_payload(self, start: int, end: int):
+        """
+        Map a [start, end) span of self.text to the original payload
+
+        Spans running past their segment are clipped to it.
+
+        Returns:
+            (start, end) in the payload, or None if the span is empty
+        """
+        index = bisect.bisect_right(self.starts, start) - 1
+        if index < 0:
+            return None
+        segment = self.segments[index]
+        local_start = start - self.starts[index]
+        local_end = min(end - self.starts[index], len(segment["text"]))
+        if local_start >= local_end:
+            return None
+        offsets = segment["offsets"]
+        return offsets[local_start], offsets[local_end]
+
+    def remap(self, findings: dict, payload: str) -> dict:
+        """
+        Map a detections dict found in self.text back onto the payload
+
+        Args:
+            findings: {type: [{"span", "start", "end", ...}]} from a detector
+            payload: Original payload text
+
+        Returns:
+            Detections dict with payload offsets and spans
+        """
+        remapped = {}
+        for kind, items in findings.items():
+            for item in items:
+                span = self.to_payload(item.get("start", 0), item.get("end", 0))
+                if span is None:
+                    continue
+                start, end = span
+                remapped.setdefault(kind, []).append(
+                    {**item, "span": payload[start:end], "start": start, "end": end}
+                )
+        return remapped
+
+
+def merge_findings(detected: dict, findings: dict) -> dict:
+    """
+    Merge findings into detected, dropping spans that overlap existing ones
+
+    Overlapping spans would corrupt custom_redact_text, so the first
+    detector to claim a span wins.
+    """
+    taken = [
+        (item["start"], item["end"])
+        for items in detected.values()
+        for item in items
+    ]
+    for kind, items in findings.items():
+        for item in items:
+            start, end = item.get("start"), item.get("end")
+            if start is None or end is None:
+                continue
+            if any(start < t_end and t_start < end for t_start, t_end in taken):
+                continue
+            taken.append((start, end))
+            detected.setdefault(kind, []).append(item)
+    return detected
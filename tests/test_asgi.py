@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Tests that the ASGI app keeps the Flask app's route contracts
+"""
+import threading
+
+import pytest
+
+pytest.importorskip("starlette")
+
+from starlette.testclient import TestClient
+
+
+@pytest.fixture
+def asgi(proxy, monkeypatch, tmp_path):
+    """asgi module on top of the stub-backed proxy, logging to a temp file"""
+    monkeypatch.setattr("logger.LOG_PATH", tmp_path / "logs.jsonl")
+    import asgi as module
+    return module
+
+
+@pytest.fixture
+def client(asgi):
+    return TestClient(asgi.app)
+
+
+def test_health_check(client):
+    response = client.get("/api/health_check")
+    assert response.status_code == 200
+    assert response.text == "Zero Harm AI Flask backend is running."
+
+
+def test_check_privacy(client):
+    response = client.post("/api/check_privacy", json={"text": "mail a@b.com"})
+    assert response.status_code == 200
+    assert response.json() == {
+        "redacted": "mail [REDACTED_EMAIL]",
+        "detectors": {"EMAIL": [{"span": "a@b.com", "start": 5, "end": 12}]},
+    }
+
+
+def test_check_privacy_runs_on_detection_executor(asgi, client, monkeypatch):
+    threads = []
+
+    def fake_process_prompt(prompt):
+        threads.append(threading.current_thread().name)
+        return prompt, {}
+    monkeypatch.setattr(asgi, "process_prompt", fake_process_prompt)
+
+    response = client.post("/api/check_privacy", json={"text": "hello"})
+    assert response.status_code == 200
+    assert len(threads) == 1
+    assert threads[0].startswith("detection")
+
+
+def test_check_privacy_error(client):
+    response = client.post("/api/check_privacy", json={})
+    assert response.status_code == 500
+    assert "error" in response.json()
+
+
+def test_contact_sends_email(asgi, client, monkeypatch):
+    sent = []
+    monkeypatch.setattr(asgi, "send_contact_email", lambda *args: sent.append(args))
+
+    response = client.post("/api/contact", json={
+        "email": "a@b.com", "name": "Ann", "message": "Hi",
+        "company": "Acme", "inquiryType": "sales",
+    })
+    assert response.status_code == 200
+    assert response.json() == {"message": "Email sent successfully"}
+    assert sent == [("a@b.com", "Ann", "Hi", "Acme", "sales")]
+
+
+def test_contact_send_failure(asgi, client, monkeypatch):
+    def fail(*args):
+        raise OSError("smtp down")
+    monkeypatch.setattr(asgi, "send_contact_email", fail)
+
+    response = client.post("/api/contact", json={
+        "email": "a@b.com", "name": "Ann", "message": "Hi",
+    })
+    assert response.status_code == 500
+    assert response.json() == {"error": "smtp down"}
+
+
+def test_contact_missing_fields(client):
+    response = client.post("/api/contact", json={"email": "a@b.com"})
+    assert response.status_code == 400
+    assert response.json()["error"] == "Missing required fields"
+
+
+@pytest.mark.parametrize("body", [b"", b"{not json"])
+def test_contact_malformed_body(client, body):
+    response = client.post("/api/contact", content=body,
+                           headers={"Content-Type": "application/json"})
+    assert response.status_code == 400
+    assert "error" in response.json()
+
+
+def test_cors_preflight(client):
+    response = client.options("/api/check_privacy", headers={
+        "Origin": "https://example.com",
+        "Access-Control-Request-Method": "POST",
+    })
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-origin"] == "*"
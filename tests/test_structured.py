@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Tests for structure-aware routing of JSON, code and log payloads
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from structured import (
+    detect_payload_kind, extract_segments, SegmentDocument, merge_findings,
+    PAYLOAD_JSON, PAYLOAD_CODE, PAYLOAD_LOG, ROLE_PROSE, ROLE_TOKEN,
+)
+
+
+def _find(segments, text):
+    return next(s for s in segments if s["text"] == text)
+
+
+def _remap_substring(payload, segments, needle):
+    """Locate needle in the joined document and map it back to the payload"""
+    doc = SegmentDocument(segments)
+    start = doc.text.index(needle)
+    findings = {"EMAIL": [{"span": needle, "start": start, "end": start + len(needle)}]}
+    return doc.remap(findings, payload)["EMAIL"][0]
+
+
+def test_payload_kind_detection():
+    """Plain prompts stay on the full pipeline"""
+    assert detect_payload_kind("Email me at test@example.com") is None
+    assert detect_payload_kind("Hello there.\nHow are you?") is None
+    assert detect_payload_kind("int main() {\n  printf(\"hi\");\n  return 0;\n}") == PAYLOAD_CODE
+    assert detect_payload_kind('{"user": "john@example.com"}') == PAYLOAD_JSON
+    assert detect_payload_kind("{not json}") is None
+    assert detect_payload_kind(
+        "def main():\n    x = load()\n    return x\n"
+    ) == PAYLOAD_CODE
+    assert detect_payload_kind(
+        "2024-05-01 10:00:00 INFO started\n2024-05-01 10:00:01 ERROR failed\n"
+    ) == PAYLOAD_LOG
+    assert detect_payload_kind(
+        'Traceback (most recent call last):\n  File "a.py", line 1, in <module>\nValueError: bad\n'
+    ) == PAYLOAD_LOG
+
+
+# Prose that only looks a little like code must keep the full scan
+PLAIN_PROSE = [
+    "My SSN is 123-45-6789;\nplease keep it private;",
+    "Dear HR,\nif you need me, my SSN is 123-45-6789\nfor the form.",
+    "@john please email bob@example.com\nthanks",
+    "Steps: {\nemail bob@example.com\n}",
+    "Hi team,\nfrom Monday we move offices.\nwith love, Bob (bob@example.com)\n}",
+    "Please return it;\nThanks John;\nreturn the car to bob@example.com;",
+]
+# Prose mixed with enough code to be routed as code - its prose lines still count
+MIXED_PROSE_AND_CODE = "Why does this fail for bob@example.com?\nx = load()\ny = x + 1\nMy SSN is 123-45-6789"
+PROSE_LOOKALIKES = PLAIN_PROSE + [MIXED_PROSE_AND_CODE]
+
+
+@pytest.mark.parametrize("text", PLAIN_PROSE)
+def test_prose_lookalikes_stay_plain(text):
+    assert detect_payload_kind(text) is None
+
+
+def test_mixed_prose_and_code_keeps_prose_lines():
+    assert detect_payload_kind(MIXED_PROSE_AND_CODE) == PAYLOAD_CODE
+    segments = extract_segments(MIXED_PROSE_AND_CODE, PAYLOAD_CODE)
+
+    assert [(s["text"], s["role"]) for s in segments] == [
+        ("Why does this fail for bob@example.com?", ROLE_PROSE),
+        ("My SSN is 123-45-6789", ROLE_PROSE),
+    ]
+
+
+def test_fenced_code_block():
+    """Fence lines are skipped and the fenced block is scanned as code"""
+    payload = (
+        "Can you fix this? Jane Doe wrote it\n"
+        "```python\n"
+        "def f():\n"
+        "    x = 'call Bob later'\n"
+        "    return x\n"
+        "```\n"
+        "Thanks\n"
+    )
+    segments = extract_segments(payload, PAYLOAD_CODE)
+
+    assert [(s["text"], s["role"]) for s in segments] == [
+        ("Can you fix this? Jane Doe wrote it", ROLE_PROSE),
+        ("call Bob later", ROLE_PROSE),
+        ("Thanks", ROLE_PROSE),
+    ]
+
+
+def test_json_keys_and_values_routed_by_shape():
+    payload = (
+        '{"email": "john@example.com", "note": "Call John Smith tomorrow", "id": 42,'
+        ' "I will hurt John Smith": true, "name": "Bob", "city": "Paris", "ref": "jsmith_42"}'
+    )
+    segments = extract_segments(payload, PAYLOAD_JSON)
+
+    assert _find(segments, "email")["role"] == ROLE_TOKEN
+    assert _find(segments, "note")["role"] == ROLE_TOKEN
+    assert _find(segments, "I will hurt John Smith")["role"] == ROLE_PROSE
+    assert _find(segments, "john@example.com")["role"] == ROLE_TOKEN
+    assert _find(segments, "Call John Smith tomorrow")["role"] == ROLE_PROSE
+    assert _find(segments, "42")["role"] == ROLE_TOKEN
+    assert _find(segments, "jsmith_42")["role"] == ROLE_TOKEN
+    # Single-word values are the usual name/city fields - NER still sees them
+    assert _find(segments, "Bob")["role"] == ROLE_PROSE
+    assert _find(segments, "Paris")["role"] == ROLE_PROSE
+
+
+def test_json_escapes_map_to_original_offsets():
+    payload = '{"msg": "line one\\nreach me: a\\u0040b.com"}'
+    segments = extract_segments(payload, PAYLOAD_JSON)
+    assert segments[1]["text"] == "line one\nreach me: a@b.com"
+
+    item = _remap_substring(payload, segments, "a@b.com")
+    assert payload[item["start"]:item["end"]] == "a\\u0040b.com"
+    assert item["span"] == "a\\u0040b.com"
+
+
+def test_json_escaped_emoji():
+    """Surrogate pairs decode to one character the tokenizer can encode"""
+    payload = json.dumps({"note": "hi \U0001F600 mail bob@example.com"})
+    assert "\\ud83d\\ude00" in payload
+
+    segments = extract_segments(payload, PAYLOAD_JSON)
+    text = _find(segments, "hi \U0001F600 mail bob@example.com")["text"]
+    text.encode("utf-8")
+
+    item = _remap_substring(payload, segments, "bob@example.com")
+    assert item["span"] == "bob@example.com"
+
+    doc = SegmentDocument(segments)
+    emoji = doc.text.index("\U0001F600")
+    start, end = doc.to_payload(emoji, emoji + 1)
+    assert payload[start:end] == "\\ud83d\\ude00"
+
+
+def test_json_lone_surrogate_is_replaced():
+    segments = extract_segments('{"k": "a\\ud83d b"}', PAYLOAD_JSON)
+    assert segments[1]["text"] == "a\ufffd b"
+
+
+def test_code_strings_and_comments():
+    payload = (
+        "import os\n"
+        "# Ask Jane Doe before changing this\n"
+        "API_KEY = 'sk-abc123'\n"
+        "def send():\n"
+        "    return post(\"jane@example.com\")  // trailing note here\n"
+    )
+    segments = extract_segments(payload, PAYLOAD_CODE)
+    texts = [s["text"] for s in segments]
+
+    assert texts == [
+        "Ask Jane Doe before changing this",
+        "sk-abc123",
+        "jane@example.com",
+        "trailing note here",
+    ]
+    item = _remap_substring(payload, segments, "jane@example.com")
+    assert item["span"] == "jane@example.com"
+    assert payload[item["start"]:item["end"]] == "jane@example.com"
+
+
+def test_log_messages_and_traceback_source():
+    payload = (
+        "2024-05-01 10:00:00,123 ERROR [worker-1] Login failed for bob@example.com\n"
+        "Traceback (most recent call last):\n"
+        '  File "/srv/app.py", line 10, in login\n'
+        '    check("bob@example.com")\n'
+        "ValueError: user Bob Jones is locked\n"
+    )
+    segments = extract_segments(payload, PAYLOAD_LOG)
+    texts = [s["text"] for s in segments]
+
+    assert "Login failed for bob@example.com" in texts
+    assert "bob@example.com" in texts
+    assert "ValueError: user Bob Jones is locked" in texts
+    assert not any("/srv/app.py" in t for t in texts)
+    assert not any(t.startswith("2024-05-01") for t in texts)
+
+
+def test_remap_clips_to_segment():
+    payload = '["first value", "second value"]'
+    segments = extract_segments(payload, PAYLOAD_JSON)
+    doc = SegmentDocument(segments)
+    # A span crossing the separator is clipped to the segment it starts in
+    assert doc.to_payload(0, len(doc.text)) == (2, 13)
+
+
+def test_merge_findings_drops_overlaps():
+    detected = {"SECRETS": [{"span": "sk-abc123", "start": 10, "end": 19}]}
+    merge_findings(detected, {
+        "PERSON": [{"span": "abc", "start": 13, "end": 16}],
+        "EMAIL": [{"span": "a@b.co", "start": 30, "end": 36}],
+    })
+    assert "PERSON" not in detected
+    assert detected["EMAIL"][0]["start"] == 30
+
+
+# ==================== End-to-end through proxy ====================
+
+class FakePipeline:
+    """Tags "John Smith" as PERSON and anything mentioning "hurt" as harmful"""
+
+    def __init__(self):
+        self.texts = []
+
+    def detect(self, text, **kwargs):
+        self.texts.append(text)
+        detections = []
+        start = text.find("John Smith")
+        if start != -1:
+            detections.append(SimpleNamespace(
+                type="PERSON", text="John Smith", start=start, end=start + 10,
+                confidence=0.99, metadata={}))
+        harmful = "hurt" in text
+        return SimpleNamespace(
+            detections=detections, harmful=harmful,
+            severity="high" if harmful else None,
+            harmful_scores={"threat": 0.9} if harmful else {},
+            redacted_text=text)
+
+
+@pytest.fixture
+def ai_proxy(proxy, monkeypatch):
+    pipeline = FakePipeline()
+    monkeypatch.setattr(proxy, "USE_AI_DETECTION", True)
+    monkeypatch.setattr(proxy, "PIPELINE", pipeline)
+    return proxy, pipeline
+
+
+@pytest.mark.parametrize("text", PLAIN_PROSE)
+def test_plain_prose_takes_full_path(proxy, monkeypatch, text):
+    def fail(prompt, kind):
+        raise AssertionError("prose routed as structured")
+    monkeypatch.setattr(proxy, "process_prompt_structured", fail)
+    proxy.process_prompt(text)
+
+
+@pytest.mark.parametrize("text", PROSE_LOOKALIKES)
+def test_prose_lookalikes_are_redacted(proxy, text):
+    redacted, detected = proxy.process_prompt(text)
+    assert "123-45-6789" not in redacted
+    assert "bob@example.com" not in redacted
+    assert detected
+
+
+def test_structured_redacts_at_payload_offsets(proxy):
+    payload = '{"bob@example.com": "reach me: a\\u0040b.com", "key": "sk-abcdef123"}'
+    redacted, detected = proxy.process_prompt(payload)
+
+    email = next(d for d in detected["EMAIL"] if d["span"] == "a\\u0040b.com")
+    assert payload[email["start"]:email["end"]] == "a\\u0040b.com"
+    assert redacted == (
+        '{"[REDACTED_EMAIL]": "reach me: [REDACTED_EMAIL]", "key": "[REDACTED_SECRET]"}'
+    )
+
+
+def test_structured_regex_pii_outside_literals(proxy):
+    """Misrouted or bare text in a code payload still gets regex PII"""
+    payload = "import os\nimport sys\nssn = 123-45-6789\nprint(os.getcwd())\n"
+    assert detect_payload_kind(payload) == PAYLOAD_CODE
+
+    redacted, detected = proxy.process_prompt(payload)
+    assert "ssn = [REDACTED_SSN]" in redacted
+    assert detected["SSN"][0]["start"] == payload.index("123-45-6789")
+
+
+def test_structured_ai_path_scans_prose_only(ai_proxy):
+    proxy, pipeline = ai_proxy
+    payload = '{"user": {"id": "jsmith_42", "note": "Call John Smith today"}}'
+    redacted, detected = proxy.process_prompt(payload)
+
+    # Only the free-text value reaches the NER/harmful pipeline
+    assert pipeline.texts == ["Call John Smith today"]
+    person = detected["PERSON"][0]
+    assert person["start"] == payload.index("Call John Smith") + 5
+    assert payload[person["start"]:person["end"]] == "John Smith"
+    assert redacted == (
+        '{"user": {"id": "jsmith_42", "note": "Call [REDACTED_NAME] today"}}'
+    )
+
+
+def test_structured_harmful_blocks_whole_payload(ai_proxy):
+    proxy, _ = ai_proxy
+    payload = '{"msg": "I will hurt you, John Smith", "id": 7}'
+    redacted, detected = proxy.process_prompt(payload)
+
+    assert redacted == "[⚠️ HARMFUL CONTENT BLOCKED - HIGH SEVERITY]"
+    harmful = detected["HARMFUL_CONTENT"][0]
+    assert (harmful["start"], harmful["end"], harmful["span"]) == (0, len(payload), payload)
+    assert harmful["labels"] == ["threat"]
+
+
+def test_structured_short_json_values_reach_ner(ai_proxy):
+    proxy, pipeline = ai_proxy
+    proxy.process_prompt('{"name": "Bob", "city": "Paris", "id": "jsmith_42"}')
+    assert pipeline.texts == ["Bob\nParis"]
+
+
+@pytest.mark.parametrize("payload", [
+    "Why does this fail?\nx = load()\ny = x + 1\nI hate you all and will hurt everyone",
+    "Can you fix this?\n```python\ndef f():\n    x = load()\n    y = x + 1\n"
+    "    return y\n```\nI will hurt everyone if it fails",
+    '{"I will hurt John Smith tomorrow": true}',
+])
+def test_structured_harmful_prose_is_still_blocked(ai_proxy, payload):
+    """Code lines or JSON structure around harmful text must not bypass the filter"""
+    proxy, _ = ai_proxy
+    assert detect_payload_kind(payload) is not None
+
+    redacted, detected = proxy.process_prompt(payload)
+    assert redacted == "[⚠️ HARMFUL CONTENT BLOCKED - HIGH SEVERITY]"
+    assert detected["HARMFUL_CONTENT"][0]["span"] == payload